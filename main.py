@@ -3,10 +3,18 @@
 import streamlit as st
 import pandas as pd
 import requests
-from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import aiohttp
+import asyncio
+from bs4 import BeautifulSoup, SoupStrainer
 from google import genai
-import json
+import orjson
+import hashlib
 import time
+import threading
+import queue
+from concurrent.futures import ThreadPoolExecutor
 
 # --- 1. PAGE CONFIG ---
 st.set_page_config(page_title="AI SEO Index Checker", layout="wide", page_icon="🔍")
@@ -24,124 +32,458 @@ with st.sidebar:
     # st.write("Developed by: AI Dev Team")
 
 # --- 3. CORE LOGIC ---
-def check_index_bulk(urls, api_key):
+# --- Result caches (shared across reruns and sessions of this server process) ---
+CACHE_TTL = 3600  # Seconds before a cached index status / diagnosis is re-checked
+CACHE_MAX_ENTRIES = 5000  # Per cache; the oldest entries are evicted beyond this
+
+@st.cache_resource
+def _result_caches():
+    return {"index": {}, "diagnosis": {}}
+
+@st.cache_resource
+def _cache_lock():
+    # Caches are shared by every session, so guard them across script threads
+    return threading.Lock()
+
+def _cache_get(cache, key):
+    with _cache_lock():
+        hit = cache.get(key)
+    if hit and time.time() - hit[0] < CACHE_TTL:
+        return hit[1]
+    return None
+
+def _cache_put(cache, key, value):
+    now = time.time()
+    with _cache_lock():
+        # Re-insert so dict order stays oldest-first
+        cache.pop(key, None)
+        cache[key] = (now, value)
+
+        # Evict expired entries from the front, then the oldest ones over the size limit
+        while cache:
+            oldest = next(iter(cache))
+            if now - cache[oldest][0] < CACHE_TTL and len(cache) <= CACHE_MAX_ENTRIES:
+                break
+            del cache[oldest]
+
+
+def _match_key(url):
+    # Compare URLs ignoring scheme, "www.", host case and trailing slash,
+    # so "example.com/page" matches "https://www.example.com/page/"
+    key = url.strip().split("://", 1)[-1]
+    host, sep, path = key.partition('/')
+    host = host.lower()
+    if host.startswith("www."):
+        host = host[4:]
+    return (host + sep + path).rstrip('/')
+
+
+async def _check_index_bulk_async(urls, api_key, batch_size=20, concurrency=10):
+    # batch_size: keep this safely under 30 to prevent timeouts
+    # concurrency: max batches in flight at once
     endpoint = "https://google.serper.dev/search"
     headers = {'X-API-KEY': api_key, 'Content-Type': 'application/json'}
     
     # --- CONFIGURATION ---
-    BATCH_SIZE = 20  # Keep this safely under 30 to prevent timeouts
+    MAX_RETRIES = 3  # Retries per batch on 429 / 5xx before giving up
+    MAX_RETRY_WAIT = 30  # Cap on any single backoff, whatever Retry-After says
     indexed_map = {}
-    
-    # Loop through URLs in chunks of 20
-    for i in range(0, len(urls), BATCH_SIZE):
-        batch_urls = urls[i : i + BATCH_SIZE]
-        
-        # Prepare payload for this specific batch
-        payload = [{"q": f'"{u.strip()}"'} for u in batch_urls]
-        
-        try:
-            response = requests.post(endpoint, headers=headers, json=payload, timeout=30) # Increased timeout
-            
-            # Check if API returned an error (e.g., 403 Forbidden, 429 Too Many Requests)
-            if response.status_code != 200:
-                print(f"Batch failed with status {response.status_code}: {response.text}")
-                # Mark this specific batch as False, but allow others to continue
-                for u in batch_urls:
-                    indexed_map[u] = False 
-                continue
 
-            results = response.json()
-            
-            # Map results for this batch
-            for j, res in enumerate(results):
-                # Handle cases where result list might be shorter than batch (rare error)
-                if j >= len(batch_urls): 
-                    break
-                    
-                url = batch_urls[j]
-                
-                # Check organic results
-                is_found = any(url.strip().rstrip('/') in item.get('link', '').rstrip('/') 
-                               for item in res.get('organic', []))
-                
-                indexed_map[url] = is_found
+    async def post_batch(sem, session, batch_urls):
+        # Prepare payload for this specific batch (serialized once with orjson, reused on retries)
+        payload = orjson.dumps([{"q": f'"{u}"'} for u in batch_urls])
+
+        delay = 2
+        for attempt in range(MAX_RETRIES + 1):
+            async with sem:
+                try:
+                    async with session.post(endpoint, data=payload, headers=headers,
+                                            timeout=aiohttp.ClientTimeout(total=30)) as r:
+                        if r.status == 200:
+                            results = orjson.loads(await r.read())
+                            # A 200 can still carry an error object instead of the result list
+                            if not isinstance(results, list):
+                                print(f"Batch returned unexpected response: {results!r:.200}")
+                                return batch_urls, None
+                            return batch_urls, results
+
+                        # Rate limited (429) or server error (5xx): back off and retry the same batch
+                        if (r.status == 429 or r.status >= 500) and attempt < MAX_RETRIES:
+                            retry_after = r.headers.get("Retry-After", "")
+                            wait = min(int(retry_after) if retry_after.isdigit() else delay, MAX_RETRY_WAIT)
+                            print(f"Batch got status {r.status}, retrying in {wait}s")
+                        else:
+                            # Other errors (e.g., 403 Forbidden) or retries exhausted
+                            print(f"Batch failed with status {r.status}: {await r.text()}")
+                            return batch_urls, None
+                except Exception as e:
+                    print(f"Error checking batch starting at {batch_urls[0]}: {e}")
+                    return batch_urls, None
+
+            # Sleep without holding the semaphore so other batches can use the slot
+            await asyncio.sleep(wait)
+            delay *= 2
+
+    # One session (and connection pool) reused across all batches
+    sem = asyncio.Semaphore(concurrency)
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        batches = await asyncio.gather(*[
+            post_batch(sem, session, urls[i : i + batch_size])
+            for i in range(0, len(urls), batch_size)
+        ])
+
+    for batch_urls, results in batches:
+        # If a batch fails, leave its URLs out so they are not cached; the caller marks them False
+        if results is None:
+            continue
+
+        # Normalize the batch URLs once, not per organic result
+        batch_keys = [_match_key(u) for u in batch_urls]
+
+        # Map results for this batch
+        for j, res in enumerate(results):
+            # Handle cases where result list might be shorter than batch (rare error)
+            if j >= len(batch_urls): 
+                break
                 
-        except Exception as e:
-            print(f"Error checking batch {i}: {e}")
-            # If a batch fails, mark only those URLs as False
-            for u in batch_urls:
-                indexed_map[u] = False
-        
-        # Optional: Sleep briefly between batches to be safe with rate limits
-        time.sleep(1)
+            url = batch_urls[j]
+            # Skip malformed entries; the caller marks those URLs False without caching them
+            if not isinstance(res, dict):
+                continue
+            
+            # Check organic results (normalize links once into a set for O(1) lookup)
+            organic_keys = {_match_key(item.get('link', '')) for item in res.get('organic', [])
+                            if isinstance(item, dict)}
+            
+            indexed_map[url] = batch_keys[j] in organic_keys
 
     return indexed_map
 
 
-# def get_ai_diagnosis(url, gemini_client):
-#     try:
-#         res = requests.get(url, headers={'User-Agent': 'Mozilla/5.0'}, timeout=5)
-#         soup = BeautifulSoup(res.text, 'html.parser')
-#         content = f"Title: {soup.title.string if soup.title else 'N/A'} | Text: {soup.get_text()[:1000]}"
-        
-#         prompt = f"Analyze this URL: {url}\nPage Content: {content}\nProvide 1 short reason why Google might NOT index this page."
-#         response = gemini_client.models.generate_content(model="gemini-2.5-flash", contents=prompt)
-#         return response.text.strip()
-#     except:
-#         return "Failed to crawl page content."
-def get_ai_diagnosis(url, gemini_client):
-    # 1. Use "Real" Browser Headers to avoid being blocked
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-        "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,*/*;q=0.8",
-        "Accept-Language": "en-US,en;q=0.5",
-        "Referer": "https://www.google.com/"
-    }
+def check_index_bulk(urls, api_key, batch_size=20, concurrency=10):
+    # urls are already stripped and deduplicated by the input stage; _match_key handles matching
+    index_cache = _result_caches()["index"]
+    key_hash = hashlib.sha256(api_key.encode()).hexdigest()
+    indexed_map = {}
+
+    # Serve warm URLs from the cache, only send cold ones to Serper (each distinct URL once)
+    cold_urls = []
+    for u in dict.fromkeys(urls):
+        cached = _cache_get(index_cache, (u, key_hash))
+        if cached is None:
+            cold_urls.append(u)
+        else:
+            indexed_map[u] = cached
+
+    if cold_urls:
+        # Sync wrapper so the Streamlit script stays synchronous
+        fresh = asyncio.run(_check_index_bulk_async(cold_urls, api_key, batch_size, concurrency))
+        for u in cold_urls:
+            if u in fresh:
+                _cache_put(index_cache, (u, key_hash), fresh[u])
+            # URLs from failed batches are marked False for this run only
+            indexed_map[u] = fresh.get(u, False)
+
+    return indexed_map
+
+
+# --- Page crawling ---
+MAX_CRAWL_BYTES = 64 * 1024  # Only download the first 64KB of each page
+MIN_TEXT_CHARS = 200  # Less visible text than this is diagnosed as thin content without Gemini
+AUTH_WALL_KEYWORDS = ("sign in", "log in", "captcha", "access denied", "403 forbidden")
+AUTH_WALL_MAX_CHARS = 600  # Only pages this short are checked for auth-wall keywords in their body text
+
+# "Real" browser headers, built once; parallel crawls rotate through the User-Agent pool
+_UA_POOL = (
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.2 Safari/605.1.15",
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:121.0) Gecko/20100101 Firefox/121.0",
+)
+_BASE_HEADERS = {
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,*/*;q=0.8",
+    "Accept-Language": "en-US,en;q=0.5",
+    "Referer": "https://www.google.com/"
+}
+# Text-bearing tags we send to Gemini (a broad set so the thin-content check sees most visible text)
+_STRAINER = SoupStrainer(['title', 'p', 'h1', 'h2', 'h3', 'li', 'td', 'span', 'blockquote', 'article'])
+
+RETRYABLE_STATUSES = (429, 500, 502, 503, 504)  # Worth retrying, so never cached
+
+# Shared HTTP session for crawling (keeps TLS connections alive between requests)
+@st.cache_resource
+def _http_session():
+    # Built once per server process, so pooled connections survive reruns (e.g. slider moves)
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=20,
+        pool_maxsize=50,
+        max_retries=Retry(total=2, backoff_factor=0.3,
+                          status_forcelist=RETRYABLE_STATUSES,
+                          respect_retry_after_header=False,  # Third-party sites could make us wait for hours
+                          raise_on_status=False),  # Hand the final response back so we can report its status
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+# --- AI diagnosis pipeline ---
+DIAG_WORKERS = 8  # Default max parallel crawl workers
+PROGRESS_INTERVAL = 0.2  # Min seconds between progress re-renders while crawling
+GEMINI_BATCH_SIZE = 25  # Pages per Gemini request (keeps the prompt a sensible size)
+GEMINI_IDLE_FLUSH = 2.0  # Send a partial batch if no crawl finishes for this many seconds
+DIAGNOSIS_SCHEMA = {
+    "type": "ARRAY",
+    "items": {
+        "type": "OBJECT",
+        "properties": {"id": {"type": "INTEGER"}, "reason": {"type": "STRING"}},
+        "required": ["id", "reason"],
+    },
+}
+
+
+# --- Gemini rate limiting ---
+GEMINI_RPM = 30   # Stay under the Gemini requests-per-minute quota
+
+@st.cache_resource
+def _gemini_limiter():
+    # Survives reruns and is shared by every session, so they all stay within one RPM budget
+    return {"lock": threading.Lock(), "next_slot": 0.0}
+
+def _wait_for_gemini_slot(limiter):
+    # Space out Gemini calls evenly instead of a fixed sleep after each request
+    with limiter["lock"]:
+        now = time.monotonic()
+        wait = limiter["next_slot"] - now
+        limiter["next_slot"] = max(now, limiter["next_slot"]) + 60 / GEMINI_RPM
+    if wait > 0:
+        time.sleep(wait)
+
+
+def _visible_text_len(html):
+    # Full parse without the strainer; only used to double-check pages that look thin
+    soup = BeautifulSoup(html, 'lxml')
+    for tag in soup(["script", "style", "noscript"]):
+        tag.extract()
+    return len(soup.get_text(separator=' ', strip=True))
+
+
+def crawl_page(url, session):
+    # Returns (page, None) for pages Gemini should look at,
+    # or (None, diagnosis) when the crawl alone explains the problem
+
+    # 1. Use "Real" Browser Headers to avoid being blocked (User-Agent rotated per URL)
+    headers = {**_BASE_HEADERS, "User-Agent": _UA_POOL[hash(url) % len(_UA_POOL)]}
 
     try:
         # 2. Increased timeout to 15s (5s is too short for some sites)
-        res = requests.get(url, headers=headers, timeout=15)
-        
-        # 3. Check if the site blocked us (403/401) or failed (500)
-        if res.status_code != 200:
-            return f"Site blocked the crawler (Status Code: {res.status_code})."
+        #    Stream the body and stop after MAX_CRAWL_BYTES; we only keep a short text snippet anyway
+        with session.get(url, headers=headers, timeout=15, stream=True) as res:
+            
+            # 3. Check if the site blocked us (403/401) or failed (500)
+            if res.status_code in RETRYABLE_STATUSES:
+                return None, f"Error: Site temporarily unavailable (Status Code: {res.status_code})."
+            if res.status_code != 200:
+                return None, f"Site blocked the crawler (Status Code: {res.status_code})."
+
+            # PDFs, images, JSON etc. can't be parsed as a page; say so without downloading them
+            content_type = res.headers.get("Content-Type", "").lower()
+            if "html" not in content_type:
+                return None, f"Non-HTML content ({content_type.split(';')[0] or 'unknown type'})."
 
-        # 4. Parse content
-        soup = BeautifulSoup(res.text, 'html.parser')
+            chunks = []
+            total = 0
+            for chunk in res.iter_content(MAX_CRAWL_BYTES):
+                chunks.append(chunk)
+                total += len(chunk)
+                if total >= MAX_CRAWL_BYTES:
+                    break
+            html = b"".join(chunks).decode(res.encoding or 'utf-8', errors='replace')
+            truncated = total >= MAX_CRAWL_BYTES
+
+        # 4. Parse content with lxml, only building the tags we send to Gemini
+        #    (scripts, styles and nav are skipped during parsing, giving Gemini clean data)
+        soup = BeautifulSoup(html, 'lxml', parse_only=_STRAINER)
         
         # Safety check: if soup.title is None, use URL as title
         title = soup.title.string.strip() if soup.title and soup.title.string else url
         
-        # Clean text: remove script/style tags to give Gemini clean data
-        for script in soup(["script", "style"]):
-            script.extract()
-            
         page_text = soup.get_text(separator=' ', strip=True)[:1500] # Limit to 1500 chars
         
-        content = f"Title: {title}\nPage Text Snippet: {page_text}"
+        # Obvious cases don't need Gemini: save the quota and the round-trip.
+        # Articles often mention "log in" in passing, so only trust the keywords
+        # in the title or on short pages
+        lowered = title.lower() if len(page_text) > AUTH_WALL_MAX_CHARS else f"{title} {page_text}".lower()
+        if any(k in lowered for k in AUTH_WALL_KEYWORDS):
+            return None, "Login/auth wall."
+        # Only call a page thin if we read all of it (a cut-off body may be all <head>),
+        # and confirm with a full parse since the strainer skips text sitting directly in <div>s
+        if len(page_text) < MIN_TEXT_CHARS and not truncated and _visible_text_len(html) < MIN_TEXT_CHARS:
+            return None, f"Thin content (<{MIN_TEXT_CHARS} chars visible)."
         
-        # 5. Send to Gemini
-        prompt = (
-            f"Analyze this web page for SEO indexing issues.\n"
-            f"URL: {url}\n"
-            f"Content Extracted:\n{content}\n\n"
-            f"Task: The page is NOT indexed by Google. Based on the content above, "
-            f"give 1 likely technical or content reason (e.g., 'Thin content', 'Under construction', 'Login wall', 'Technical error')."
-            f"Keep it under 15 words."
-        )
-        
-        response = gemini_client.models.generate_content(model="gemini-3-flash-preview", contents=prompt)
-        return response.text.strip()
+        return {"url": url, "title": title, "snippet": page_text}, None
 
     except requests.exceptions.Timeout:
-        return "Error: Connection timed out (Site is slow)."
+        return None, "Error: Connection timed out (Site is slow)."
     except requests.exceptions.ConnectionError:
-        return "Error: Connection refused (Bot protection)."
+        return None, "Error: Connection refused (Bot protection)."
     except Exception as e:
-        return f"Error: {str(e)}"
+        return None, f"Error: {str(e)}"
+
+
+def get_batch_diagnosis(pages, gemini_client, limiter):
+    # 5. Send all crawled pages to Gemini in one request and ask for structured JSON back
+    prompt = (
+        "Analyze these web pages for SEO indexing issues. None of them are indexed by Google.\n"
+        "For each page, give 1 likely technical or content reason "
+        "(e.g., 'Thin content', 'Under construction', 'Login wall', 'Technical error'). "
+        "Keep each reason under 15 words.\n"
+        'Return a JSON array with one object per page, using the page\'s id: [{"id": 0, "reason": "..."}]\n\n'
+        + orjson.dumps([{"id": i, "url": p["url"], "title": p["title"], "snippet": p["snippet"][:800]}
+                        for i, p in enumerate(pages)]).decode()
+    )
+
+    try:
+        _wait_for_gemini_slot(limiter)
+        response = gemini_client.models.generate_content(
+            model="gemini-3-flash-preview",
+            contents=prompt,
+            config={"response_mime_type": "application/json", "response_schema": DIAGNOSIS_SCHEMA},
+        )
+        results = orjson.loads(response.text)
+
+        # Tolerate a wrapped array, e.g. {"results": [...]}
+        if isinstance(results, dict):
+            results = next((v for v in results.values() if isinstance(v, list)), None)
+        if not isinstance(results, list):
+            raise ValueError("Unexpected AI response format")
+
+        # Map the reasons back by id (Gemini may not echo URLs back exactly)
+        reasons = {str(r.get("id")): str(r.get("reason", "")).strip()
+                   for r in results if isinstance(r, dict)}
+    except Exception as e:
+        return {p["url"]: f"Error: {str(e)}" for p in pages}
+
+    return {p["url"]: reasons.get(str(i)) or "Error: No AI diagnosis returned." for i, p in enumerate(pages)}
+
+
+def get_ai_diagnoses(urls, gemini_client, on_progress=None, max_workers=DIAG_WORKERS):
+    # on_progress(message, fraction) is called from the calling thread, so it may touch Streamlit
+    diag_cache = _result_caches()["diagnosis"]
+    # Resolved here so the worker threads never touch Streamlit
+    session = _http_session()
+    limiter = _gemini_limiter()
+    diagnoses = {}
+
+    # Diagnoses change slowly, so key the cache on the URL alone
+    cold_urls = []
+    for u in urls:
+        cached = _cache_get(diag_cache, u)
+        if cached is None:
+            cold_urls.append(u)
+        else:
+            diagnoses[u] = cached
+
+    # Crawl cold URLs in parallel; some are diagnosed by the crawl alone.
+    # Workers push results onto a queue and this thread drains it, re-rendering
+    # progress at most every PROGRESS_INTERVAL seconds.
+    pages = []
+    crawled = queue.Queue()
+    gemini_futures = []
+
+    def crawl_worker(u):
+        # Always put a result, otherwise the drain loop below would wait forever
+        try:
+            result = crawl_page(u, session)
+        except Exception as e:
+            result = (None, f"Error: {str(e)}")
+        crawled.put((u, result))
+
+    # Gemini batches run on their own (single, rate limited) thread, so each batch is
+    # diagnosed while the remaining pages are still being crawled. A batch goes out when
+    # it is full, or early when no crawl has finished for GEMINI_IDLE_FLUSH seconds.
+    with ThreadPoolExecutor(max_workers=1) as gemini_executor:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for u in cold_urls:
+                executor.submit(crawl_worker, u)
+
+            last_render = 0.0
+            done = 0
+            while done < len(cold_urls):
+                try:
+                    url, (page, diag) = crawled.get(timeout=GEMINI_IDLE_FLUSH)
+                except queue.Empty:
+                    # The remaining crawls are slow; let Gemini start on what we have
+                    if pages:
+                        gemini_futures.append(gemini_executor.submit(get_batch_diagnosis, pages, gemini_client, limiter))
+                        pages = []
+                    continue
+
+                done += 1
+                if page:
+                    pages.append(page)
+                else:
+                    diagnoses[url] = diag
+
+                if len(pages) == GEMINI_BATCH_SIZE:
+                    gemini_futures.append(gemini_executor.submit(get_batch_diagnosis, pages, gemini_client, limiter))
+                    pages = []
+
+                now = time.monotonic()
+                if on_progress and (now - last_render > PROGRESS_INTERVAL or done == len(cold_urls)):
+                    on_progress(f"Crawling pages: {done}/{len(cold_urls)} done", done / len(cold_urls) * 0.8)
+                    last_render = now
+
+        # Diagnose whatever didn't fill a batch, then collect the AI results
+        if pages:
+            gemini_futures.append(gemini_executor.submit(get_batch_diagnosis, pages, gemini_client, limiter))
+        for i, future in enumerate(gemini_futures):
+            if on_progress:
+                on_progress(f"Auditing with AI: {i}/{len(gemini_futures)} batches done",
+                            0.8 + i / len(gemini_futures) * 0.2)
+            diagnoses.update(future.result())
+
+    # Don't cache transient failures (timeouts, connection errors, 429/5xx responses)
+    for u in cold_urls:
+        if not diagnoses[u].startswith("Error:"):
+            _cache_put(diag_cache, u, diagnoses[u])
+
+    return diagnoses
+
+
 # --- 4. UI INPUTS ---
 url_input = st.text_area("Enter URLs (one per line, up to 20 for trial)", height=150)
-urls = [u.strip() for u in url_input.split('\n') if u.strip()]
+# Strip whitespace once here and dedupe on the same key used for index matching (ignores
+# scheme, "www." and trailing slash), keeping the first spelling in input order.
+# URLs are crawled and displayed exactly as typed.
+urls_by_key = {}
+for line in url_input.split('\n'):
+    u = line.strip()
+    key = _match_key(u)
+    if key:
+        urls_by_key.setdefault(key, u)
+urls = list(urls_by_key.values())
+
+# Concurrency knobs: defaults are tuned to the job size, power users can raise them
+n_urls = len(urls)
+auto_knobs = {
+    "batch_size": 20 if n_urls > 50 else min(30, max(5, n_urls)),
+    "concurrency": min(8, max(2, n_urls // 10)),
+    "diag_workers": min(DIAG_WORKERS, max(1, n_urls)),
+}
+# Sliders follow the auto-tuned values until the user moves one, then keep the user's value
+last_auto = st.session_state.get("auto_knobs", {})
+for name, value in auto_knobs.items():
+    if name not in st.session_state or st.session_state[name] == last_auto.get(name):
+        st.session_state[name] = value
+st.session_state["auto_knobs"] = auto_knobs
+
+with st.sidebar:
+    st.subheader("Performance")
+    batch_size = st.slider("Serper batch size", 5, 30, key="batch_size")
+    concurrency = st.slider("Serper concurrent batches", 1, 20, key="concurrency")
+    diag_workers = st.slider("Parallel page crawls", 1, 16, key="diag_workers")
 
 if st.button("🚀 Start Bulk Audit"):
     if not serper_key or not gemini_key:
@@ -158,49 +500,53 @@ if st.button("🚀 Start Bulk Audit"):
         
         # Step A: Bulk Index Check
         status_text.text("Checking index status on Google...")
-        index_results = check_index_bulk(urls, serper_key)
+        index_results = check_index_bulk(urls, serper_key, batch_size, concurrency)
         progress_bar.progress(30)
         
-        final_data = []
-        
-        # Step B: AI Audit for Non-indexed
+        # Step B: AI Audit for Non-indexed (crawl in parallel, then batch the Gemini requests)
         total = len(urls)
-        for i, url in enumerate(urls):
+        non_indexed = [u for u in urls if not index_results.get(u, False)]
+        
+        def show_progress(message, fraction):
+            status_text.text(message)
+            progress_bar.progress(30 + int(fraction * 70))
+        
+        diagnoses = get_ai_diagnoses(non_indexed, client, on_progress=show_progress,
+                                     max_workers=min(diag_workers, max(1, len(non_indexed))))
+        
+        final_data = []
+        for url in urls:
             is_indexed = index_results.get(url, False)
-            diag = None
-            
-            if not is_indexed:
-                status_text.text(f"Auditing with AI: {url}")
-                diag = get_ai_diagnosis(url, client)
-                # Rate limit safety
-                time.sleep(2) 
+            diag = diagnoses.get(url)
             
+            # Keep raw values here; they are only formatted for display
             final_data.append({
                 "URL": url,
-                "Indexed": "✅ Yes" if is_indexed else "❌ No",
-                "AI Diagnosis": diag if diag else "N/A (Indexed)"
+                "Indexed": bool(is_indexed),
+                "AI Diagnosis": diag or None
             })
-            
-            # Update progress
-            progress_val = 30 + int((i + 1) / total * 70)
-            progress_bar.progress(progress_val)
+        progress_bar.progress(100)
 
         status_text.success("Audit Complete!")
         
         # --- 5. RESULTS DISPLAY ---
         df = pd.DataFrame(final_data)
-        st.dataframe(df, use_container_width=True)
+        df_display = df.assign(**{
+            "Indexed": df['Indexed'].map({True: "✅ Yes", False: "❌ No"}),
+            "AI Diagnosis": df['AI Diagnosis'].fillna("N/A (Indexed)"),
+        })
+        st.dataframe(df_display, use_container_width=True)
 
         # Metrics
-        indexed_count = len(df[df['Indexed'] == "✅ Yes"])
+        indexed_count = int(df['Indexed'].sum())
         col1, col2 = st.columns(2)
         col1.metric("Indexed", indexed_count)
         col2.metric("Not Indexed", total - indexed_count)
 
         # Export Options
         st.markdown("### Export Results")
-        csv = df.to_csv(index=False).encode('utf-8')
-        json_data = json.dumps(final_data, indent=4)
+        csv = df_display.to_csv(index=False).encode('utf-8')
+        json_data = orjson.dumps(final_data, option=orjson.OPT_INDENT_2)  # Already bytes
         
         c1, c2 = st.columns(2)
         c1.download_button("Download CSV", csv, "seo_audit.csv", "text/csv")